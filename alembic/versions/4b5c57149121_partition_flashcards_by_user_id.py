@@ -0,0 +1,126 @@
+"""partition flashcards by hash of user_id
+
+Revision ID: 4b5c57149121
+Revises: bc0151d2cc7c
+Create Date: 2026-10-19 12:26:55.918230
+
+Онлайн-миграция на партиционированную таблицу:
+1. создаём flashcards_partitioned (PARTITION BY HASH (user_id));
+2. триггер на старой таблице зеркалит все изменения в новую;
+3. копируем существующие строки через batched_backfill (батчи, чекпоинты, resume).
+   Батч берёт исходные строки FOR SHARE, поэтому параллельный UPDATE/DELETE ждёт
+   его коммита и затем через триггер перезаписывает или удаляет копию;
+4. в короткой транзакции меняем таблицы местами и удаляем старую.
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.backfill import batched_backfill, reset_backfill
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b5c57149121'
+down_revision: Union[str, Sequence[str], None] = 'bc0151d2cc7c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITIONS = int(os.getenv("FLASHCARDS_PARTITIONS", 16))
+BATCH_SIZE = int(os.getenv("FLASHCARDS_COPY_BATCH_SIZE", 5000))
+BATCH_PAUSE_SECONDS = float(os.getenv("FLASHCARDS_COPY_PAUSE_SECONDS", 0.05))
+
+COLUMNS = "id, topic, question, answer, user_id, language_id, status, created_at, updated_at"
+UPDATE_COLUMNS = ", ".join(
+    f"{column} = EXCLUDED.{column}" for column in COLUMNS.split(", ") if column not in ("id", "user_id")
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS flashcards_partitioned (
+            LIKE flashcards INCLUDING DEFAULTS,
+            PRIMARY KEY (id, user_id),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (language_id) REFERENCES languages (id)
+        ) PARTITION BY HASH (user_id)
+    """)
+    for remainder in range(PARTITIONS):
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS flashcards_p{remainder} PARTITION OF flashcards_partitioned "
+            f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})"
+        )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_flashcards_partitioned_id ON flashcards_partitioned (id)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_flashcards_partitioned_user_id_id ON flashcards_partitioned (user_id, id)")
+
+    # Пока идёт копирование, новые изменения попадают в обе таблицы.
+    # DDL идемпотентен: после прерванного копирования миграцию можно просто перезапустить
+    op.execute(f"""
+        CREATE OR REPLACE FUNCTION flashcards_mirror() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND OLD.user_id <> NEW.user_id) THEN
+                DELETE FROM flashcards_partitioned WHERE id = OLD.id AND user_id = OLD.user_id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                -- Изменение из триггера всегда свежее строки, скопированной батчем
+                INSERT INTO flashcards_partitioned ({COLUMNS})
+                VALUES (NEW.id, NEW.topic, NEW.question, NEW.answer, NEW.user_id,
+                        NEW.language_id, NEW.status, NEW.created_at, NEW.updated_at)
+                ON CONFLICT (id, user_id) DO UPDATE SET {UPDATE_COLUMNS};
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("DROP TRIGGER IF EXISTS flashcards_mirror ON flashcards")
+    op.execute("""
+        CREATE TRIGGER flashcards_mirror AFTER INSERT OR UPDATE OR DELETE ON flashcards
+        FOR EACH ROW EXECUTE FUNCTION flashcards_mirror()
+    """)
+
+    with op.get_context().autocommit_block():
+        batched_backfill(
+            op.get_bind(),
+            name="flashcards_partition_copy",
+            table="flashcards",
+            statement=f"""
+                INSERT INTO flashcards_partitioned ({COLUMNS})
+                SELECT {COLUMNS} FROM flashcards WHERE id > :lo AND id <= :hi
+                FOR SHARE
+                ON CONFLICT (id, user_id) DO NOTHING
+            """,
+            batch_size=BATCH_SIZE,
+            pause_seconds=BATCH_PAUSE_SECONDS,
+        )
+
+    op.execute("LOCK TABLE flashcards IN ACCESS EXCLUSIVE MODE")
+    op.execute("ALTER SEQUENCE flashcards_id_seq OWNED BY flashcards_partitioned.id")
+    op.execute("DROP TABLE flashcards")
+    op.execute("DROP FUNCTION flashcards_mirror()")
+    op.execute("ALTER TABLE flashcards_partitioned RENAME TO flashcards")
+    op.execute("ALTER TABLE flashcards RENAME CONSTRAINT flashcards_partitioned_pkey TO flashcards_pkey")
+    op.execute("ALTER INDEX ix_flashcards_partitioned_id RENAME TO ix_flashcards_id")
+    op.execute("ALTER INDEX ix_flashcards_partitioned_user_id_id RENAME TO ix_flashcards_user_id_id")
+    reset_backfill(op.get_bind(), "flashcards_partition_copy")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("""
+        CREATE TABLE flashcards_unpartitioned (
+            LIKE flashcards INCLUDING DEFAULTS,
+            PRIMARY KEY (id),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (language_id) REFERENCES languages (id)
+        )
+    """)
+    op.execute(f"INSERT INTO flashcards_unpartitioned ({COLUMNS}) SELECT {COLUMNS} FROM flashcards")
+    op.execute("ALTER SEQUENCE flashcards_id_seq OWNED BY flashcards_unpartitioned.id")
+    op.execute("DROP TABLE flashcards")
+    op.execute("ALTER TABLE flashcards_unpartitioned RENAME TO flashcards")
+    op.execute("ALTER TABLE flashcards RENAME CONSTRAINT flashcards_unpartitioned_pkey TO flashcards_pkey")
+    op.create_index(op.f('ix_flashcards_id'), 'flashcards', ['id'], unique=False)
+    op.create_index('ix_flashcards_user_id_id', 'flashcards', ['user_id', 'id'], unique=False)
@@ -0,0 +1,110 @@
+"""add flashcard_facet_counts
+
+Revision ID: 5773f5cf3cb9
+Revises: 59ff1888043b
+Create Date: 2026-10-19 17:52:31.904376
+
+Индексы строятся без долгих блокировок: на родительской таблице — ON ONLY
+(пустой и невалидный), на каждой партиции — CONCURRENTLY, затем партиционные
+индексы подключаются через ATTACH PARTITION, и родительский становится валидным.
+Начальные счётчики заполняются через batched_backfill по диапазонам users.id:
+каждый батч целиком пересчитывает счётчики своих пользователей и перезаписывает
+их, поэтому повтор батча ничего не портит. Приложение в это время уже обновляет
+счётчики (app/facets.py), поэтому батч сначала блокирует пользователей FOR UPDATE
+(новые карточки ждут на проверке FK) и их карточки FOR UPDATE (ждут изменения и
+удаления), а пересчитывает уже следующим запросом — со свежим снимком, в котором
+видны все закоммиченные изменения. Изменения, ждавшие блокировки, применят свои
+дельты поверх пересчитанных значений.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.backfill import batched_backfill, reset_backfill
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5773f5cf3cb9'
+down_revision: Union[str, Sequence[str], None] = '59ff1888043b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# имя индекса -> колонки
+INDEXES = {
+    "ix_flashcards_user_id_topic": "user_id, topic",
+    "ix_flashcards_user_id_language_id": "user_id, language_id",
+}
+
+SEED_BATCH_USERS = 100
+
+SEED_STATEMENTS = [
+    "SELECT 1 FROM users WHERE id > :lo AND id <= :hi FOR UPDATE",
+    "SELECT 1 FROM flashcards WHERE user_id > :lo AND user_id <= :hi FOR UPDATE",
+    "DELETE FROM flashcard_facet_counts WHERE user_id > :lo AND user_id <= :hi",
+    """
+    INSERT INTO flashcard_facet_counts (user_id, facet, value, count)
+    SELECT user_id, 'topic', COALESCE(topic, ''), count(*) FROM flashcards
+    WHERE user_id > :lo AND user_id <= :hi GROUP BY user_id, COALESCE(topic, '')
+    UNION ALL
+    SELECT user_id, 'language', language_id::text, count(*) FROM flashcards
+    WHERE user_id > :lo AND user_id <= :hi GROUP BY user_id, language_id
+    UNION ALL
+    SELECT user_id, 'status', lower(status::text), count(*) FROM flashcards
+    WHERE user_id > :lo AND user_id <= :hi GROUP BY user_id, status
+    ON CONFLICT (user_id, facet, value) DO UPDATE SET count = EXCLUDED.count
+    """,
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('flashcard_facet_counts',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('facet', sa.String(), nullable=False),
+    sa.Column('value', sa.String(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'facet', 'value')
+    )
+    bind = op.get_bind()
+    for name, columns in INDEXES.items():
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON ONLY flashcards ({columns})")
+    partitions = [row[0] for row in bind.execute(sa.text("""
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = 'flashcards'::regclass
+        ORDER BY child.relname
+    """))]
+
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            for partition in partitions:
+                partition_index = name.replace("ix_flashcards_", f"ix_{partition}_", 1)
+                # Прерванный CREATE INDEX CONCURRENTLY оставляет невалидный индекс
+                invalid = bind.execute(sa.text("""
+                    SELECT NOT indisvalid FROM pg_index
+                    WHERE indexrelid = to_regclass(:name)
+                """), {"name": partition_index}).scalar()
+                if invalid:
+                    op.execute(f"DROP INDEX CONCURRENTLY {partition_index}")
+                op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition_index} ON {partition} ({columns})")
+                op.execute(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}")
+
+        # Начальные значения счётчиков по уже существующим карточкам
+        batched_backfill(
+            bind,
+            name="flashcard_facet_counts_seed",
+            table="users",
+            statement=SEED_STATEMENTS,
+            batch_size=SEED_BATCH_USERS,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_flashcards_user_id_language_id', table_name='flashcards')
+    op.drop_index('ix_flashcards_user_id_topic', table_name='flashcards')
+    op.drop_table('flashcard_facet_counts')
+    reset_backfill(op.get_bind(), "flashcard_facet_counts_seed")
@@ -0,0 +1,44 @@
+"""add quiz_sessions
+
+Revision ID: 59ff1888043b
+Revises: 5e68d7633208
+Create Date: 2026-10-19 16:37:50.628417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '59ff1888043b'
+down_revision: Union[str, Sequence[str], None] = '5e68d7633208'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('quiz_sessions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', postgresql.ENUM('NEW', 'INPROGRESS', 'DONE', name='flashcardstatus', create_type=False), nullable=True),
+    sa.Column('language_id', sa.Integer(), nullable=True),
+    sa.Column('topic', sa.String(), nullable=True),
+    sa.Column('seen', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['language_id'], ['languages.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_quiz_sessions_id'), 'quiz_sessions', ['id'], unique=False)
+    op.create_index(op.f('ix_quiz_sessions_user_id'), 'quiz_sessions', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_quiz_sessions_user_id'), table_name='quiz_sessions')
+    op.drop_index(op.f('ix_quiz_sessions_id'), table_name='quiz_sessions')
+    op.drop_table('quiz_sessions')
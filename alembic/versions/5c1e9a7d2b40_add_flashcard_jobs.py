@@ -0,0 +1,51 @@
+"""add flashcard_jobs
+
+Revision ID: 5c1e9a7d2b40
+Revises: 3b32b42c86a6
+Create Date: 2026-10-19 10:12:41.305517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5c1e9a7d2b40'
+down_revision: Union[str, Sequence[str], None] = '3b32b42c86a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('flashcard_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('language_id', sa.Integer(), nullable=False),
+    sa.Column('topic', sa.String(), nullable=True),
+    sa.Column('source_text', sa.Text(), nullable=True),
+    sa.Column('requested_count', sa.Integer(), nullable=False),
+    sa.Column('created_count', sa.Integer(), nullable=False),
+    sa.Column('status', sa.Enum('PENDING', 'RUNNING', 'DONE', 'FAILED', name='flashcardjobstatus'), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('lease_token', sa.String(), nullable=True),
+    sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['language_id'], ['languages.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_flashcard_jobs_id'), 'flashcard_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_flashcard_jobs_user_id'), 'flashcard_jobs', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_flashcard_jobs_user_id'), table_name='flashcard_jobs')
+    op.drop_index(op.f('ix_flashcard_jobs_id'), table_name='flashcard_jobs')
+    op.drop_table('flashcard_jobs')
+    sa.Enum(name='flashcardjobstatus').drop(op.get_bind(), checkfirst=True)
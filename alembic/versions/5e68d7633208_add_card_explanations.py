@@ -0,0 +1,34 @@
+"""add card_explanations
+
+Revision ID: 5e68d7633208
+Revises: 80217f9a9f1e
+Create Date: 2026-10-19 15:44:09.113852
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e68d7633208'
+down_revision: Union[str, Sequence[str], None] = '80217f9a9f1e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('card_explanations',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('language_code', sa.String(), nullable=False),
+    sa.Column('explanation', sa.Text(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('card_explanations')
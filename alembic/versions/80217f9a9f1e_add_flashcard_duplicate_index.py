@@ -0,0 +1,90 @@
+"""add flashcard near-duplicate index
+
+Revision ID: 80217f9a9f1e
+Revises: e014c74de11e
+Create Date: 2026-10-19 14:58:22.470136
+
+Сигнатуры и LSH-корзины уже существующих карточек считаются здесь, батчами по id,
+чтобы GET /flashcards/duplicates только читал индекс. Новые карточки индексируются
+при создании. Прерванную миграцию можно перезапустить: батч пересчитывает только
+карточки без сигнатуры и сначала удаляет их корзины.
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.dedupe import band_buckets, compute_signature
+
+
+# revision identifiers, used by Alembic.
+revision: str = '80217f9a9f1e'
+down_revision: Union[str, Sequence[str], None] = 'e014c74de11e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = int(os.getenv("FLASHCARDS_DEDUPE_BATCH_SIZE", 500))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('flashcards', sa.Column('signature', sa.LargeBinary(), nullable=True))
+    op.add_column('flashcards', sa.Column('duplicate_of_id', sa.Integer(), nullable=True))
+    op.create_table('flashcard_lsh_bands',
+    sa.Column('flashcard_id', sa.Integer(), nullable=False),
+    sa.Column('band', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('flashcard_id', 'band')
+    )
+    op.create_index('ix_flashcard_lsh_bands_lookup', 'flashcard_lsh_bands', ['user_id', 'band', 'bucket'], unique=False)
+
+    with op.get_context().autocommit_block():
+        _index_existing_flashcards(op.get_bind())
+
+
+def _index_existing_flashcards(bind) -> None:
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.text("""
+            SELECT id, user_id, question, answer FROM flashcards
+            WHERE id > :last_id AND signature IS NULL
+            ORDER BY id LIMIT :limit
+        """), {"last_id": last_id, "limit": BATCH_SIZE}).all()
+        if not rows:
+            return
+        signatures = {row.id: compute_signature(row.question, row.answer) for row in rows}
+
+        # Каждый запрос коммитится сам; сигнатура пишется последней, поэтому
+        # после обрыва батч просто пересчитается заново
+        bind.execute(
+            sa.text("DELETE FROM flashcard_lsh_bands WHERE flashcard_id IN :ids")
+            .bindparams(sa.bindparam("ids", expanding=True)),
+            {"ids": list(signatures)},
+        )
+        bind.execute(sa.text("""
+            INSERT INTO flashcard_lsh_bands (flashcard_id, band, user_id, bucket)
+            VALUES (:flashcard_id, :band, :user_id, :bucket)
+        """), [
+            {"flashcard_id": row.id, "band": band, "user_id": row.user_id, "bucket": bucket}
+            for row in rows
+            for band, bucket in band_buckets(signatures[row.id])
+        ])
+        bind.execute(sa.text("""
+            UPDATE flashcards SET signature = :signature
+            WHERE id = :id AND user_id = :user_id
+        """), [
+            {"id": row.id, "user_id": row.user_id, "signature": signatures[row.id]}
+            for row in rows
+        ])
+        last_id = rows[-1].id
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_flashcard_lsh_bands_lookup', table_name='flashcard_lsh_bands')
+    op.drop_table('flashcard_lsh_bands')
+    op.drop_column('flashcards', 'duplicate_of_id')
+    op.drop_column('flashcards', 'signature')
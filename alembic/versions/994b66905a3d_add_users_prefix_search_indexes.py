@@ -0,0 +1,39 @@
+"""add users prefix search indexes
+
+Revision ID: 994b66905a3d
+Revises: 353a30bc942f
+Create Date: 2026-10-19 19:31:48.207164
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '994b66905a3d'
+down_revision: Union[str, Sequence[str], None] = '353a30bc942f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # text_pattern_ops нужен, чтобы LIKE 'prefix%' использовал индекс при любой локали
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_lower_full_name "
+            "ON users (lower(full_name) text_pattern_ops)"
+        )
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_lower_email "
+            "ON users (lower(email) text_pattern_ops)"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_users_lower_email")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_users_lower_full_name")
@@ -0,0 +1,79 @@
+"""backfill flashcards.language_id in batches
+
+Revision ID: e014c74de11e
+Revises: 4b5c57149121
+Create Date: 2026-10-19 13:41:07.284611
+
+Тот же backfill, что задумывался в 3b32b42c86a6 (add language_id safely),
+но через batched_backfill: карточки без языка получают DEFAULT_LANGUAGE_CODE
+батчами, и только потом колонка становится NOT NULL.
+
+SET NOT NULL сам по себе сканирует всю таблицу под ACCESS EXCLUSIVE. Поэтому
+сначала добавляем CHECK (language_id IS NOT NULL) NOT VALID (он же не даёт новых
+NULL во время backfill'а), после backfill'а проверяем его через VALIDATE CONSTRAINT
+(SHARE UPDATE EXCLUSIVE, запись не блокируется), и тогда SET NOT NULL обходится
+без сканирования. Сам CHECK после этого больше не нужен.
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.backfill import batched_backfill
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e014c74de11e'
+down_revision: Union[str, Sequence[str], None] = '4b5c57149121'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DEFAULT_LANGUAGE_CODE = os.getenv("DEFAULT_LANGUAGE_CODE", "en")
+NOT_NULL_CHECK = "ck_flashcards_language_id_not_null"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+
+    op.execute(f"ALTER TABLE flashcards DROP CONSTRAINT IF EXISTS {NOT_NULL_CHECK}")
+    op.execute(f"ALTER TABLE flashcards ADD CONSTRAINT {NOT_NULL_CHECK} CHECK (language_id IS NOT NULL) NOT VALID")
+
+    has_missing = bind.execute(sa.text(
+        "SELECT EXISTS (SELECT 1 FROM flashcards WHERE language_id IS NULL)"
+    )).scalar()
+    if has_missing:
+        bind.execute(sa.text(
+            "INSERT INTO languages (code) VALUES (:code) ON CONFLICT (code) DO NOTHING"
+        ), {"code": DEFAULT_LANGUAGE_CODE})
+        language_id = bind.execute(sa.text(
+            "SELECT id FROM languages WHERE code = :code"
+        ), {"code": DEFAULT_LANGUAGE_CODE}).scalar()
+
+    with op.get_context().autocommit_block():
+        if has_missing:
+            batched_backfill(
+                bind,
+                name="flashcards_language_id",
+                table="flashcards",
+                statement="""
+                    UPDATE flashcards SET language_id = :language_id
+                    WHERE id > :lo AND id <= :hi AND language_id IS NULL
+                """,
+                params={"language_id": language_id},
+                where="language_id IS NULL",
+            )
+        op.execute(f"ALTER TABLE flashcards VALIDATE CONSTRAINT {NOT_NULL_CHECK}")
+
+    # Валидный CHECK доказывает отсутствие NULL, поэтому здесь нет сканирования таблицы
+    op.execute("SET LOCAL lock_timeout = '5s'")
+    op.alter_column('flashcards', 'language_id', existing_type=sa.Integer(), nullable=False)
+    op.execute(f"ALTER TABLE flashcards DROP CONSTRAINT {NOT_NULL_CHECK}")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Данные не трогаем: заполненный language_id совместим с предыдущей схемой
+    pass
@@ -0,0 +1,146 @@
+"""Батчевые backfill'ы для Alembic-миграций.
+
+Вместо одного UPDATE на всю таблицу строки обрабатываются батчами по ключу
+(keyset: key > :lo AND key <= :hi), каждый батч — отдельная короткая транзакция
+с lock_timeout / statement_timeout. Прогресс сохраняется в
+data_migration_checkpoints в той же транзакции, что и батч, поэтому прерванная
+миграция продолжит с места остановки и ни один батч не применится дважды.
+
+Пример — паттерн «добавить nullable колонку, заполнить, сделать NOT NULL»:
+
+    op.add_column('flashcards', sa.Column('language_id', sa.Integer(), nullable=True))
+    with op.get_context().autocommit_block():
+        batched_backfill(
+            op.get_bind(),
+            name="flashcards_language_id",
+            table="flashcards",
+            statement=\"\"\"
+                UPDATE flashcards SET language_id = :language_id
+                WHERE id > :lo AND id <= :hi AND language_id IS NULL
+            \"\"\",
+            params={"language_id": language_id},
+        )
+    op.alter_column('flashcards', 'language_id', nullable=False)
+"""
+import logging
+import time
+
+import sqlalchemy as sa
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger("alembic.backfill")
+
+CHECKPOINTS_TABLE = "data_migration_checkpoints"
+
+checkpoints = sa.Table(
+    CHECKPOINTS_TABLE,
+    sa.MetaData(),
+    sa.Column("name", sa.String(), primary_key=True),
+    sa.Column("last_key", sa.BigInteger(), nullable=False),
+    sa.Column("rows_done", sa.BigInteger(), nullable=False),
+    sa.Column("finished", sa.Boolean(), nullable=False),
+    sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+)
+
+
+def batched_backfill(
+    bind,
+    name: str,
+    table: str,
+    statement: str | list[str],
+    params: dict | None = None,
+    key: str = "id",
+    where: str | None = None,
+    batch_size: int = 1000,
+    lock_timeout: str = "2s",
+    statement_timeout: str = "30s",
+    pause_seconds: float = 0.1,
+    max_retries: int = 5,
+) -> int:
+    """Выполняет statement батчами по возрастанию key и возвращает число обработанных строк.
+
+    statement получает границы батча как :lo (не включительно) и :hi (включительно).
+    Список statement'ов выполняется по порядку в одной транзакции (например, сначала
+    блокировка, потом пересчёт); число строк берётся из последнего.
+    where сужает выборку ключей (например, "language_id IS NULL"), чтобы
+    не гонять пустые батчи по уже заполненной части таблицы.
+    Вызывать внутри op.get_context().autocommit_block(): батчи идут через отдельные
+    транзакции и не должны ждать блокировок, которые держит сама миграция.
+    """
+    checkpoints.create(bind, checkfirst=True)
+    state = bind.execute(sa.select(checkpoints).where(checkpoints.c.name == name)).first()
+    if state is not None and state.finished:
+        logger.info("Backfill %s already finished", name)
+        return state.rows_done
+
+    last_key = state.last_key if state is not None else 0
+    rows_done = state.rows_done if state is not None else 0
+    if state is None:
+        bind.execute(checkpoints.insert().values(name=name, last_key=0, rows_done=0, finished=False))
+
+    next_batch = sa.text(f"""
+        SELECT max({key}) FROM (
+            SELECT {key} FROM {table}
+            WHERE {key} > :lo {f"AND ({where})" if where else ""}
+            ORDER BY {key} LIMIT :batch_size
+        ) AS batch
+    """)
+    statements = [sa.text(sql) for sql in ([statement] if isinstance(statement, str) else statement)]
+    timeouts = (
+        [sa.text(f"SET LOCAL lock_timeout = '{lock_timeout}'"),
+         sa.text(f"SET LOCAL statement_timeout = '{statement_timeout}'")]
+        if bind.dialect.name == "postgresql" else []
+    )
+
+    while True:
+        upper = bind.execute(next_batch, {"lo": last_key, "batch_size": batch_size}).scalar()
+        if upper is None:
+            break
+
+        batch_params = {**(params or {}), "lo": last_key, "hi": upper}
+        rowcount = _apply_with_retry(
+            bind.engine, timeouts, statements, batch_params,
+            checkpoints.update()
+            .where(checkpoints.c.name == name)
+            .values(last_key=upper, rows_done=checkpoints.c.rows_done + sa.bindparam("rowcount"),
+                    updated_at=sa.func.now()),
+            max_retries,
+        )
+        last_key = upper
+        rows_done += rowcount
+        logger.info("Backfill %s: %s rows, %s <= %s", name, rows_done, key, last_key)
+        time.sleep(pause_seconds)
+
+    bind.execute(
+        checkpoints.update()
+        .where(checkpoints.c.name == name)
+        .values(finished=True, updated_at=sa.func.now())
+    )
+    return rows_done
+
+
+def reset_backfill(bind, name: str) -> None:
+    """Удаляет чекпоинт, чтобы backfill прошёл заново (например, в downgrade)"""
+    checkpoints.create(bind, checkfirst=True)
+    bind.execute(checkpoints.delete().where(checkpoints.c.name == name))
+
+
+def _apply_with_retry(engine, timeouts, statements, params: dict, checkpoint, max_retries: int) -> int:
+    # Батч вместе с чекпоинтом — одна транзакция; не дождавшийся блокировки батч
+    # откатывается целиком и повторяется с растущей паузой
+    for attempt in range(1, max_retries + 1):
+        try:
+            with engine.begin() as conn:
+                for statement in timeouts:
+                    conn.execute(statement)
+                for statement in statements:
+                    result = conn.execute(statement, params)
+                rowcount = max(result.rowcount, 0)
+                conn.execute(checkpoint, {"rowcount": rowcount})
+                return rowcount
+        except OperationalError as e:
+            if attempt == max_retries:
+                raise
+            delay = 0.5 * 2 ** (attempt - 1)
+            logger.warning("Backfill batch failed (%s), retry in %.1fs", e.orig, delay)
+            time.sleep(delay)
@@ -0,0 +1,137 @@
+import os
+
+import google.generativeai as genai
+from sqlalchemy.orm import Session
+
+from app.jobs import GEMINI_MODEL
+from app.models import ChatSession
+
+# 🔹 Бюджет контекста диалога (резюме + последние реплики), в токенах
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", 2000))
+# Сколько последних реплик никогда не сворачиваем в резюме
+CHAT_KEEP_RECENT_TURNS = int(os.getenv("CHAT_KEEP_RECENT_TURNS", 4))
+CHAT_SUMMARY_MAX_WORDS = 150
+
+SYSTEM_PROMPT = "You are a friendly language tutor in the LinguaAI app."
+
+
+def estimate_tokens(text: str | None) -> int:
+    # Грубая оценка (~4 символа на токен) — без лишнего запроса count_tokens
+    return len(text) // 4 + 1 if text else 0
+
+
+def context_tokens(summary: str | None, turns: list[dict]) -> int:
+    return estimate_tokens(summary) + sum(estimate_tokens(t["text"]) for t in turns)
+
+
+def get_or_create_session(db: Session, user_id: int, session_id: int | None) -> ChatSession | None:
+    """None, если сессия не найдена или принадлежит другому пользователю"""
+    if session_id is None:
+        session = ChatSession(user_id=user_id, turns=[])
+        db.add(session)
+        db.flush()
+        return session
+
+    return db.query(ChatSession).filter(
+        ChatSession.id == session_id,
+        ChatSession.user_id == user_id
+    ).first()
+
+
+def send_message(db: Session, session: ChatSession, message: str) -> str:
+    """Отправляет сообщение в чат Gemini с историей сессии и сохраняет ответ.
+
+    Транзакция закрывается до запроса к Gemini (и до резюмирования), чтобы
+    соединение из пула не простаивало, пока модель отвечает; ответ сохраняется
+    отдельной короткой транзакцией.
+    """
+    session_id, summary, turns = session.id, session.summary, list(session.turns)
+    db.commit()
+
+    system_instruction = SYSTEM_PROMPT
+    if summary:
+        system_instruction += f"\nSummary of the conversation so far:\n{summary}"
+
+    model = genai.GenerativeModel(GEMINI_MODEL, system_instruction=system_instruction)
+    chat = model.start_chat(history=[
+        {"role": turn["role"], "parts": [turn["text"]]} for turn in turns
+    ])
+    response = chat.send_message(message)
+
+    turns = turns + [
+        {"role": "user", "text": message},
+        {"role": "model", "text": response.text},
+    ]
+    if context_tokens(summary, turns) > CHAT_CONTEXT_TOKEN_BUDGET:
+        summary, turns = compact(summary, turns)
+
+    session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+    if session is not None:  # сессию могли удалить, пока ждали ответ
+        session.summary = summary
+        # JSON-колонку переприсваиваем целиком, чтобы SQLAlchemy увидел изменение
+        session.turns = turns
+        db.commit()
+    return response.text
+
+
+def compact(summary: str | None, turns: list[dict]) -> tuple[str | None, list[dict]]:
+    """Ужимает контекст до половины бюджета, возвращает новые (резюме, реплики).
+
+    Старые реплики сворачиваются в резюме, а последние CHAT_KEEP_RECENT_TURNS,
+    если сами не влезают, обрезаются. Запас в полбюджета нужен, чтобы резюме
+    пересчитывалось только когда он израсходован, а не на каждом сообщении.
+    """
+    turns = list(turns)
+    target = CHAT_CONTEXT_TOKEN_BUDGET // 2
+    total = context_tokens(summary, turns)
+
+    folded = []
+    while len(turns) > CHAT_KEEP_RECENT_TURNS and total > target:
+        turn = turns.pop(0)
+        folded.append(turn)
+        total -= estimate_tokens(turn["text"])
+    # История чата Gemini должна начинаться с реплики пользователя
+    while turns and turns[0]["role"] != "user":
+        folded.append(turns.pop(0))
+
+    if folded:
+        summary = _truncate(summarize(summary, folded), CHAT_CONTEXT_TOKEN_BUDGET // 4)
+
+    return summary, _fit_turns(turns, target - estimate_tokens(summary))
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max(0, (max_tokens - 1) * 4 - 1)] + "…"
+
+
+def _fit_turns(turns: list[dict], budget: int) -> list[dict]:
+    """Обрезает самые длинные реплики так, чтобы их сумма уложилась в budget"""
+    lengths = sorted(estimate_tokens(turn["text"]) for turn in turns)
+    remaining = max(budget, len(turns))
+    for i, length in enumerate(lengths):
+        share = remaining // (len(lengths) - i)
+        if length > share:
+            cap = max(share, 1)
+            break
+        remaining -= length
+    else:
+        return turns
+
+    return [
+        {**turn, "text": _truncate(turn["text"], cap)} if estimate_tokens(turn["text"]) > cap else turn
+        for turn in turns
+    ]
+
+
+def summarize(summary: str | None, turns: list[dict]) -> str:
+    dialog = "\n".join(f"{turn['role']}: {turn['text']}" for turn in turns)
+    prompt = (
+        f"Update the summary of a tutoring conversation in at most {CHAT_SUMMARY_MAX_WORDS} words. "
+        "Keep the learner's goals, level, studied words and open questions.\n"
+        f"Current summary:\n{summary or '(empty)'}\n"
+        f"New messages:\n{dialog}"
+    )
+    model = genai.GenerativeModel(GEMINI_MODEL)
+    return model.generate_content(prompt).text.strip()
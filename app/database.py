@@ -1,5 +1,13 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+import json
+import os
+import random
+import threading
+import time
+
+from fastapi import Request, Response
+from sqlalchemy import create_engine, event, text, Insert, Update, Delete
+from sqlalchemy.exc import DBAPIError, OperationalError
+from sqlalchemy.orm import declarative_base, sessionmaker, Session
 
 # 🔹 Настройки подключения
 DB_USER = "macook"          # пользователь PostgreSQL
@@ -8,21 +16,235 @@ DB_HOST = "localhost"       # адрес сервера (локально)
 DB_PORT = "5432"            # порт PostgreSQL
 DB_NAME = "linguaai"        # твоя база данных
 
-DATABASE_URL = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+)
+# 🔹 Реплики только для чтения, через запятую (можно две локальные SQLite/Postgres базы)
+DATABASE_REPLICA_URLS = [
+    url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+]
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", 5))
+REPLICA_HEALTH_TTL_SECONDS = float(os.getenv("REPLICA_HEALTH_TTL_SECONDS", 2))
+REPLICA_CONNECT_TIMEOUT_SECONDS = int(os.getenv("REPLICA_CONNECT_TIMEOUT_SECONDS", 2))
+# Сколько секунд после записи клиент читает только с primary
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+STICKY_COOKIE = "db_primary_until"
 
 # 🔹 Создаём движок SQLAlchemy
 engine = create_engine(DATABASE_URL, echo=True)
 
+
+def _create_replica_engine(url: str):
+    # Короткий таймаут подключения, чтобы недоступная реплика быстро считалась упавшей
+    connect_args = {"connect_timeout": REPLICA_CONNECT_TIMEOUT_SECONDS} if url.startswith("postgresql") else {}
+    return create_engine(url, echo=True, pool_pre_ping=True, connect_args=connect_args)
+
+
+replica_engines = [_create_replica_engine(url) for url in DATABASE_REPLICA_URLS]
+
 # 🔹 Базовый класс для моделей
 Base = declarative_base()
 
+
+# ========== Выбор реплики ==========
+
+# engine -> здорова ли реплика; заполняет фоновый поток, запросы только читают
+_replica_health: dict = {}
+_health_thread: threading.Thread | None = None
+_health_lock = threading.Lock()
+# ключ клиента -> до какого времени читать с primary
+_recent_writers: dict[str, float] = {}
+
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+def _probe_replica(replica) -> bool:
+    try:
+        with replica.connect() as conn:
+            if replica.dialect.name == "postgresql":
+                lag = conn.execute(REPLICA_LAG_QUERY).scalar() or 0
+                return float(lag) <= REPLICA_MAX_LAG_SECONDS
+            conn.execute(text("SELECT 1"))
+            return True
+    except Exception:
+        return False
+
+
+def _probe_forever() -> None:
+    while True:
+        for replica in replica_engines:
+            _replica_health[replica] = _probe_replica(replica)
+        time.sleep(REPLICA_HEALTH_TTL_SECONDS)
+
+
+def _ensure_health_thread() -> None:
+    # Проверки идут в одном фоновом потоке, чтобы запросы не ждали таймаут до мёртвой реплики
+    global _health_thread
+    if _health_thread is not None or not replica_engines:
+        return
+    with _health_lock:
+        if _health_thread is None:
+            _health_thread = threading.Thread(target=_probe_forever, name="replica-health", daemon=True)
+            _health_thread.start()
+
+
+def is_replica_healthy(replica) -> bool:
+    """Пока реплику ни разу не проверили, считаем её недоступной"""
+    return _replica_health.get(replica, False)
+
+
+def mark_replica_down(replica) -> None:
+    # До следующей проверки фонового потока
+    _replica_health[replica] = False
+
+
+def _on_replica_error(context):
+    # Упавшую реплику сразу исключаем, следующие запросы уйдут на primary
+    if context.engine is not None and (
+        context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError)
+    ):
+        mark_replica_down(context.engine)
+
+
+for _replica in replica_engines:
+    event.listen(_replica, "handle_error", _on_replica_error)
+
+
+def choose_replica():
+    """Случайная здоровая реплика или None (тогда читаем с primary)"""
+    _ensure_health_thread()
+    candidates = list(replica_engines)
+    random.shuffle(candidates)
+    for replica in candidates:
+        if is_replica_healthy(replica):
+            return replica
+    return None
+
+
+class RoutingSession(Session):
+    """Сессия, которая отправляет чтение на реплику, а запись — на primary.
+
+    Реплика выбирается один раз на сессию, чтобы внутри одного запроса
+    не читать с реплик с разным отставанием.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if (
+            self.info.get("read_only")
+            and not self._flushing
+            and not isinstance(clause, (Insert, Update, Delete))
+        ):
+            if "replica" not in self.info:
+                self.info["replica"] = choose_replica()
+            if self.info["replica"] is not None:
+                return self.info["replica"]
+        return engine
+
+    def execute(self, statement, *args, **kwargs):
+        try:
+            return super().execute(statement, *args, **kwargs)
+        except DBAPIError as e:
+            replica = self.info.get("replica")
+            if replica is None or not (e.connection_invalidated or isinstance(e, OperationalError)):
+                raise
+            # Реплика упала посреди запроса: повторяем чтение на primary
+            mark_replica_down(replica)
+            self.rollback()
+            self.info["replica"] = None
+            return super().execute(statement, *args, **kwargs)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _remember_write(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _stick_to_primary(session):
+    if not session.info.pop("wrote", False):
+        return
+    until = time.time() + READ_YOUR_WRITES_SECONDS
+    client_key = session.info.get("client_key")
+    if client_key:
+        if len(_recent_writers) > 10000:
+            now = time.time()
+            for key in [k for k, v in _recent_writers.items() if v <= now]:
+                _recent_writers.pop(key, None)
+        _recent_writers[client_key] = until
+    # Cookie нужна, чтобы следующее чтение попало на primary и в другом воркере
+    response = session.info.get("response")
+    if response is not None and replica_engines:
+        response.set_cookie(
+            key=STICKY_COOKIE,
+            value=f"{until:.0f}",
+            max_age=int(READ_YOUR_WRITES_SECONDS) + 1,
+            httponly=True,
+            samesite="lax",
+        )
+
+
+def _client_key(request: Request) -> str | None:
+    return (
+        request.headers.get("authorization")
+        or request.cookies.get("access_token")
+        or (request.client.host if request.client else None)
+    )
+
+
+def _wrote_recently(request: Request, client_key: str | None) -> bool:
+    now = time.time()
+    try:
+        if float(request.cookies.get(STICKY_COOKIE, 0)) > now:
+            return True
+    except ValueError:
+        pass
+    until = _recent_writers.get(client_key)
+    if until is None:
+        return False
+    if until <= now:
+        _recent_writers.pop(client_key, None)
+        return False
+    return True
+
+
 # 🔹 Сессия для работы с базой
-SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+SessionLocal = sessionmaker(bind=engine, class_=RoutingSession, autoflush=False, autocommit=False)
 
 # 🔹 Пример функции для получения сессии
-def get_db():
+def get_db(request: Request, response: Response):
+    db = SessionLocal()
+    db.info["client_key"] = _client_key(request)
+    db.info["response"] = response
+    try:
+        yield db
+    finally:
+        db.close()
+
+# 🔹 Сессия для эндпоинтов только на чтение: идёт на реплику, если она жива и не отстаёт
+def get_read_db(request: Request):
     db = SessionLocal()
+    db.info["read_only"] = bool(replica_engines) and not _wrote_recently(request, _client_key(request))
     try:
         yield db
     finally:
         db.close()
+
+
+# 🔹 Оценка числа строк по статистике планировщика вместо COUNT(*)
+def estimate_row_count(db: Session, query) -> int:
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return query.order_by(None).count()
+
+    sql = str(query.order_by(None).statement.compile(
+        dialect=bind.dialect, compile_kwargs={"literal_binds": True}
+    ))
+    plan = db.execute(text("EXPLAIN (FORMAT JSON) " + sql.replace(":", "\\:"))).scalar()
+    plan = plan if isinstance(plan, list) else json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
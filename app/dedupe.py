@@ -0,0 +1,217 @@
+"""Поиск почти одинаковых флешкарт через MinHash + LSH.
+
+Для каждой карточки считаем MinHash-сигнатуру по символьным триграммам
+нормализованного текста вопроса и ответа (Flashcard.signature) и раскладываем её
+по LSH-корзинам (flashcard_lsh_bands). Кандидаты в дубликаты — карточки того же
+пользователя, совпавшие хотя бы в одной корзине; их похожесть проверяем по сигнатурам.
+"""
+import os
+import random
+import re
+import struct
+import unicodedata
+import zlib
+from typing import NamedTuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from app.models import Flashcard, FlashcardLshBand
+
+# 128 перестановок: погрешность оценки ~0.035 при J = 0.8 (у 32 было ~0.07, и
+# короткие «die Katze» / «die Katzen» получали 0.84)
+NUM_PERMUTATIONS = 128
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+SHINGLE_SIZE = 3
+# Оценка коэффициента Жаккара, начиная с которой карточки считаются дубликатами
+DUPLICATE_THRESHOLD = float(os.getenv("FLASHCARD_DUPLICATE_THRESHOLD", 0.8))
+# У коротких карточек одна буква меняет заметную долю триграмм, поэтому порог выше
+SHORT_TEXT_LENGTH = 32
+SHORT_DUPLICATE_THRESHOLD = float(os.getenv("FLASHCARD_SHORT_DUPLICATE_THRESHOLD", 0.9))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(1729)  # фиксированный seed: сигнатуры хранятся в БД
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+_SIGNATURE_FORMAT = f"<{NUM_PERMUTATIONS}I"
+_NON_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Нижний регистр, без пунктуации и лишних пробелов"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _NON_WORD.sub(" ", text)
+    return _SPACES.sub(" ", text).strip()
+
+
+def _shingles(text: str) -> set[int]:
+    if len(text) <= SHINGLE_SIZE:
+        return {zlib.crc32(text.encode("utf-8"))}
+    return {
+        zlib.crc32(text[i:i + SHINGLE_SIZE].encode("utf-8"))
+        for i in range(len(text) - SHINGLE_SIZE + 1)
+    }
+
+
+class Duplicate(NamedTuple):
+    flashcard_id: int
+    score: float
+    # Нормализованные вопросы совпадают: только такие карточки можно сливать
+    same_question: bool
+
+
+def _card_text(question: str, answer: str) -> str:
+    return f"{normalize_text(question)} | {normalize_text(answer)}"
+
+
+def compute_signature(question: str, answer: str) -> bytes:
+    shingles = _shingles(_card_text(question, answer))
+    signature = [
+        min((a * s + b) % _MERSENNE_PRIME for s in shingles) & _MAX_HASH
+        for a, b in _PERMUTATIONS
+    ]
+    return struct.pack(_SIGNATURE_FORMAT, *signature)
+
+
+def similarity(left: bytes, right: bytes) -> float:
+    left_values = struct.unpack(_SIGNATURE_FORMAT, left)
+    right_values = struct.unpack(_SIGNATURE_FORMAT, right)
+    return sum(l == r for l, r in zip(left_values, right_values)) / NUM_PERMUTATIONS
+
+
+def duplicate_threshold(*texts: str) -> float:
+    """Порог похожести для пары карточек с нормализованными текстами texts"""
+    if min(len(text) for text in texts) < SHORT_TEXT_LENGTH:
+        return SHORT_DUPLICATE_THRESHOLD
+    return DUPLICATE_THRESHOLD
+
+
+def band_buckets(signature: bytes) -> list[tuple[int, int]]:
+    """Пары (номер полосы, хэш корзины) для LSH-индекса"""
+    step = ROWS_PER_BAND * 4
+    return [
+        (band, zlib.crc32(signature[band * step:(band + 1) * step]))
+        for band in range(BANDS)
+    ]
+
+
+def find_duplicates(
+    db: Session, user_id: int, question: str, answer: str, signature: bytes, exclude_id: int | None = None
+) -> list[Duplicate]:
+    """Дубликаты карточки в колоде пользователя, лучшие первыми"""
+    return find_duplicates_many(db, user_id, [(question, answer, signature)], exclude_id)[0]
+
+
+def find_duplicates_many(
+    db: Session, user_id: int, cards: list[tuple[str, str, bytes]], exclude_id: int | None = None
+) -> list[list[Duplicate]]:
+    """find_duplicates для нескольких карточек (вопрос, ответ, сигнатура) за два запроса"""
+    buckets = {bucket for _, _, signature in cards for bucket in band_buckets(signature)}
+    candidate_ids = {
+        flashcard_id
+        for (flashcard_id,) in db.query(FlashcardLshBand.flashcard_id).filter(
+            FlashcardLshBand.user_id == user_id,
+            tuple_(FlashcardLshBand.band, FlashcardLshBand.bucket).in_(buckets),
+        ).distinct()
+    } if buckets else set()
+    candidate_ids.discard(exclude_id)
+    if not candidate_ids:
+        return [[] for _ in cards]
+
+    candidates = [
+        (flashcard_id, normalize_text(question), _card_text(question, answer), candidate_signature)
+        for flashcard_id, question, answer, candidate_signature in db.query(
+            Flashcard.id, Flashcard.question, Flashcard.answer, Flashcard.signature
+        ).filter(
+            Flashcard.user_id == user_id,
+            Flashcard.id.in_(candidate_ids),
+        )
+        if candidate_signature is not None
+    ]
+
+    results = []
+    for question, answer, signature in cards:
+        normalized_question, text = normalize_text(question), _card_text(question, answer)
+        matches = []
+        for flashcard_id, candidate_question, candidate_text, candidate_signature in candidates:
+            score = similarity(signature, candidate_signature)
+            if score >= duplicate_threshold(text, candidate_text):
+                matches.append(Duplicate(flashcard_id, score, candidate_question == normalized_question))
+        matches.sort(key=lambda match: (-match.score, match.flashcard_id))
+        results.append(matches)
+    return results
+
+
+def lsh_bands(flashcard: Flashcard) -> list[FlashcardLshBand]:
+    """Строки LSH-индекса для карточки с id и сигнатурой"""
+    return [
+        FlashcardLshBand(flashcard_id=flashcard.id, user_id=flashcard.user_id, band=band, bucket=bucket)
+        for band, bucket in band_buckets(flashcard.signature)
+    ]
+
+
+def index_flashcard(db: Session, flashcard: Flashcard, signature: bytes | None = None) -> None:
+    """Обновляет сигнатуру и LSH-корзины карточки (карточка должна иметь id)"""
+    flashcard.signature = signature or compute_signature(flashcard.question, flashcard.answer)
+    db.query(FlashcardLshBand).filter(FlashcardLshBand.flashcard_id == flashcard.id).delete(
+        synchronize_session=False
+    )
+    db.add_all(lsh_bands(flashcard))
+
+
+def unindex_flashcard(db: Session, flashcard_id: int) -> None:
+    db.query(FlashcardLshBand).filter(FlashcardLshBand.flashcard_id == flashcard_id).delete(
+        synchronize_session=False
+    )
+
+
+def scan_duplicates(db: Session, user_id: int) -> list[list[int]]:
+    """Группы id почти одинаковых карточек во всей колоде пользователя"""
+    buckets: dict[tuple[int, int], list[int]] = {}
+    for band, bucket, flashcard_id in db.query(
+        FlashcardLshBand.band, FlashcardLshBand.bucket, FlashcardLshBand.flashcard_id
+    ).filter(FlashcardLshBand.user_id == user_id):
+        buckets.setdefault((band, bucket), []).append(flashcard_id)
+
+    candidates = [ids for ids in buckets.values() if len(ids) > 1]
+    if not candidates:
+        return []
+
+    signatures, texts = {}, {}
+    for flashcard_id, question, answer, signature in db.query(
+        Flashcard.id, Flashcard.question, Flashcard.answer, Flashcard.signature
+    ).filter(
+        Flashcard.user_id == user_id,
+        Flashcard.id.in_({flashcard_id for ids in candidates for flashcard_id in ids}),
+    ):
+        signatures[flashcard_id] = signature
+        texts[flashcard_id] = _card_text(question, answer)
+
+    # Union-find по подтверждённым парам; внутри корзины сравниваем с первым элементом
+    parent: dict[int, int] = {}
+
+    def find(flashcard_id: int) -> int:
+        while parent.get(flashcard_id, flashcard_id) != flashcard_id:
+            flashcard_id = parent[flashcard_id]
+        return flashcard_id
+
+    for ids in candidates:
+        ids = sorted(ids)
+        head = ids[0]
+        for other in ids[1:]:
+            if signatures.get(head) and signatures.get(other) and \
+                    similarity(signatures[head], signatures[other]) >= duplicate_threshold(texts[head], texts[other]):
+                parent[find(other)] = find(head)
+
+    groups: dict[int, list[int]] = {}
+    for flashcard_id in parent:
+        groups.setdefault(find(flashcard_id), []).append(flashcard_id)
+    for root, members in groups.items():
+        if root not in members:
+            members.append(root)
+    return sorted(sorted(members) for members in groups.values())
@@ -0,0 +1,95 @@
+"""Общий кэш объяснений Gemini для флешкарт.
+
+Ключ — sha256 от кода языка и нормализованного текста вопроса и ответа, поэтому
+одинаковые карточки разных пользователей используют одно объяснение, а изменённая
+через update_flashcard карточка автоматически получает новый ключ.
+"""
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import google.generativeai as genai
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.dedupe import normalize_text
+from app.jobs import GEMINI_MODEL
+from app.models import CardExplanation
+
+logger = logging.getLogger(__name__)
+
+# Ключи, которые сейчас генерируются в фоне
+_warming: set[str] = set()
+_warming_lock = threading.Lock()
+MAX_WARMING = 50
+# Свой небольшой пул, чтобы прогрев не занимал воркеры генерации карточек
+WARM_WORKERS = int(os.getenv("EXPLANATION_WARM_WORKERS", 2))
+warm_executor = ThreadPoolExecutor(max_workers=WARM_WORKERS, thread_name_prefix="explanation-warm")
+
+
+def explanation_key(question: str, answer: str, language_code: str) -> str:
+    content = "\n".join([language_code.lower(), normalize_text(question), normalize_text(answer)])
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_cached(db: Session, key: str) -> CardExplanation | None:
+    return db.query(CardExplanation).filter(CardExplanation.key == key).first()
+
+
+def get_or_create(db: Session, question: str, answer: str, language_code: str) -> tuple[CardExplanation, bool]:
+    """Объяснение из кэша или новое от Gemini; второй элемент — было ли оно в кэше"""
+    key = explanation_key(question, answer, language_code)
+    cached = get_cached(db, key)
+    if cached is not None:
+        return cached, True
+    # Не держим транзакцию (и соединение из пула) открытой, пока ждём Gemini
+    db.rollback()
+
+    explanation = CardExplanation(
+        key=key,
+        language_code=language_code,
+        explanation=generate_explanation(question, answer, language_code),
+    )
+    db.add(explanation)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Параллельный запрос успел сохранить то же объяснение
+        db.rollback()
+        return get_cached(db, key), True
+    return explanation, False
+
+
+def generate_explanation(question: str, answer: str, language_code: str) -> str:
+    prompt = (
+        f"A learner of the language '{language_code}' studies this flashcard.\n"
+        f"Question: {question}\nAnswer: {answer}\n"
+        "Explain the meaning and usage briefly and give three example sentences with translations."
+    )
+    model = genai.GenerativeModel(GEMINI_MODEL)
+    return model.generate_content(prompt).text.strip()
+
+
+def warm(question: str, answer: str, language_code: str) -> None:
+    """Генерирует объяснение в фоне, если его ещё нет в кэше"""
+    key = explanation_key(question, answer, language_code)
+    with _warming_lock:
+        if key in _warming or len(_warming) >= MAX_WARMING:
+            return
+        _warming.add(key)
+    warm_executor.submit(_warm, key, question, answer, language_code)
+
+
+def _warm(key: str, question: str, answer: str, language_code: str) -> None:
+    db = SessionLocal()
+    try:
+        get_or_create(db, question, answer, language_code)
+    except Exception:
+        logger.exception("Failed to warm explanation %s", key)
+    finally:
+        db.close()
+        with _warming_lock:
+            _warming.discard(key)
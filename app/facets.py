@@ -0,0 +1,108 @@
+"""Счётчики карточек по темам, языкам и статусам для каждого пользователя.
+
+Счётчики хранятся в flashcard_facet_counts и обновляются инкрементально в том же
+flush, что и сами карточки (событие after_flush), поэтому чтение фасетов — это
+выборка нескольких строк, а не GROUP BY по всей колоде.
+"""
+from collections import Counter
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.database import RoutingSession
+from app.models import Flashcard, FlashcardFacetCount, Languages
+
+# фасет -> атрибут Flashcard
+FACETS = {
+    "topic": "topic",
+    "language": "language_id",
+    "status": "status",
+}
+
+
+def _facet_value(attr: str, value) -> str:
+    if attr == "status":
+        return getattr(value, "value", value) or "new"
+    # NULL не может быть частью первичного ключа, тему без названия храним как "".
+    # Наружу она отдаётся как null, а фильтр по ней — GET /flashcards?no_topic=true
+    return "" if value is None else str(value)
+
+
+def _old_value(flashcard: Flashcard, attr: str):
+    history = inspect(flashcard).attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(flashcard, attr)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _update_facet_counts(session, flush_context):
+    deltas = Counter()
+
+    for flashcard in session.new:
+        if isinstance(flashcard, Flashcard):
+            for facet, attr in FACETS.items():
+                deltas[(flashcard.user_id, facet, _facet_value(attr, getattr(flashcard, attr)))] += 1
+
+    for flashcard in session.deleted:
+        if isinstance(flashcard, Flashcard):
+            for facet, attr in FACETS.items():
+                deltas[(flashcard.user_id, facet, _facet_value(attr, _old_value(flashcard, attr)))] -= 1
+
+    for flashcard in session.dirty:
+        if not isinstance(flashcard, Flashcard) or flashcard in session.deleted:
+            continue
+        state = inspect(flashcard)
+        for facet, attr in FACETS.items():
+            history = state.attrs[attr].history
+            if not history.has_changes():
+                continue
+            old = _facet_value(attr, history.deleted[0] if history.deleted else None)
+            new = _facet_value(attr, history.added[0] if history.added else None)
+            if old != new:
+                deltas[(flashcard.user_id, facet, old)] -= 1
+                deltas[(flashcard.user_id, facet, new)] += 1
+
+    rows = [
+        {"user_id": user_id, "facet": facet, "value": value, "count": delta}
+        for (user_id, facet, value), delta in deltas.items()
+        if delta
+    ]
+    if rows:
+        connection = session.connection()
+        connection.execute(_upsert(connection.dialect.name, rows))
+
+
+def _upsert(dialect_name: str, rows: list[dict]):
+    dialect = postgresql if dialect_name == "postgresql" else sqlite
+    table = FlashcardFacetCount.__table__
+    # Сортировка строк уменьшает шанс дедлока между параллельными транзакциями
+    rows = sorted(rows, key=lambda row: (row["user_id"], row["facet"], row["value"]))
+    stmt = dialect.insert(table).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.facet, table.c.value],
+        set_={"count": table.c["count"] + stmt.excluded["count"]},
+    )
+
+
+def get_facets(db: Session, user_id: int) -> dict:
+    rows = db.query(FlashcardFacetCount).filter(
+        FlashcardFacetCount.user_id == user_id,
+        FlashcardFacetCount.count > 0,
+    ).order_by(FlashcardFacetCount.count.desc(), FlashcardFacetCount.value).all()
+
+    language_ids = [int(row.value) for row in rows if row.facet == "language"]
+    codes = dict(
+        db.query(Languages.id, Languages.code).filter(Languages.id.in_(language_ids))
+    ) if language_ids else {}
+
+    facets = {"topics": [], "languages": [], "statuses": []}
+    for row in rows:
+        if row.facet == "topic":
+            facets["topics"].append({"value": row.value or None, "count": row.count})
+        elif row.facet == "language":
+            facets["languages"].append({"value": codes.get(int(row.value)), "count": row.count})
+        elif row.facet == "status":
+            facets["statuses"].append({"value": row.value, "count": row.count})
+    return facets
@@ -0,0 +1,320 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from sqlalchemy import and_, or_
+
+from app.database import SessionLocal
+from app.dedupe import compute_signature, find_duplicates_many, lsh_bands, normalize_text
+from app.models import Flashcard, FlashcardJob, FlashcardJobStatus, FlashcardStatus
+
+logger = logging.getLogger(__name__)
+
+GEMINI_MODEL = "gemini-2.0-flash"
+
+# 🔹 Настройки пула фоновых задач
+JOB_WORKERS = int(os.getenv("FLASHCARD_JOB_WORKERS", 2))
+JOB_QUEUE_LIMIT = int(os.getenv("FLASHCARD_JOB_QUEUE_LIMIT", 20))
+JOB_MAX_ATTEMPTS = int(os.getenv("FLASHCARD_JOB_MAX_ATTEMPTS", 4))
+JOB_BACKOFF_SECONDS = float(os.getenv("FLASHCARD_JOB_BACKOFF_SECONDS", 2))
+JOB_CHUNK_SIZE = 20  # сколько карточек просим у Gemini за один запрос
+# Аренда задачи продлевается на каждом шаге; истёкшую может забрать другой воркер.
+# Должна быть больше, чем один запрос к Gemini со всеми повторами
+JOB_LEASE_SECONDS = int(os.getenv("FLASHCARD_JOB_LEASE_SECONDS", 300))
+# Как часто ищем задачи, которые никто не выполняет: аренда истекла (воркер в
+# другом процессе умер) или задача не поместилась в очередь
+JOB_SWEEP_SECONDS = float(os.getenv("FLASHCARD_JOB_SWEEP_SECONDS", 30))
+
+# Ошибки Gemini, после которых имеет смысл повторить запрос
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+)
+
+executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="flashcard-job")
+# Ограничиваем очередь: задачи в работе + ожидающие
+_slots = threading.BoundedSemaphore(JOB_QUEUE_LIMIT)
+# Задачи, уже стоящие в очереди этого процесса, повторно не ставим
+_queued: set[int] = set()
+_queued_lock = threading.Lock()
+_sweep_thread: threading.Thread | None = None
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class GenerationParseError(Exception):
+    pass
+
+
+def submit_job(job_id: int) -> None:
+    """Ставит задачу в пул; бросает JobQueueFull, если очередь заполнена"""
+    with _queued_lock:
+        if job_id in _queued:
+            return
+        if not _slots.acquire(blocking=False):
+            raise JobQueueFull()
+        _queued.add(job_id)
+    try:
+        executor.submit(_run_job, job_id)
+    except Exception:
+        _release(job_id)
+        raise
+
+
+def _release(job_id: int) -> None:
+    with _queued_lock:
+        _queued.discard(job_id)
+    _slots.release()
+
+
+def resume_unfinished_jobs() -> None:
+    """Ставит в очередь новые задачи и задачи, чья аренда истекла (воркер умер)"""
+    db = SessionLocal()
+    try:
+        job_ids = [
+            job_id
+            for (job_id,) in db.query(FlashcardJob.id)
+            .filter(_claimable(datetime.now(timezone.utc)))
+            .order_by(FlashcardJob.id)
+        ]
+    finally:
+        db.close()
+
+    for submitted, job_id in enumerate(job_ids):
+        try:
+            submit_job(job_id)
+        except JobQueueFull:
+            logger.warning("Flashcard job queue is full, %s jobs left pending", len(job_ids) - submitted)
+            break
+
+
+def _sweep_forever() -> None:
+    while True:
+        time.sleep(JOB_SWEEP_SECONDS)
+        try:
+            resume_unfinished_jobs()
+        except Exception:
+            logger.exception("Failed to sweep flashcard jobs")
+
+
+def start_sweep() -> None:
+    """Подбирает незавершённые задачи сейчас и затем каждые JOB_SWEEP_SECONDS"""
+    global _sweep_thread
+    if _sweep_thread is not None:
+        return
+    resume_unfinished_jobs()
+    _sweep_thread = threading.Thread(target=_sweep_forever, name="flashcard-job-sweep", daemon=True)
+    _sweep_thread.start()
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def _claimable(now: datetime):
+    return or_(
+        FlashcardJob.status == FlashcardJobStatus.PENDING,
+        and_(
+            FlashcardJob.status == FlashcardJobStatus.RUNNING,
+            or_(FlashcardJob.lease_expires_at.is_(None), FlashcardJob.lease_expires_at < now),
+        ),
+    )
+
+
+def _claim(db, job_id: int, token: str) -> bool:
+    """Атомарно забирает задачу: только один воркер получит rowcount == 1"""
+    now = datetime.now(timezone.utc)
+    claimed = db.query(FlashcardJob).filter(FlashcardJob.id == job_id, _claimable(now)).update(
+        {
+            FlashcardJob.status: FlashcardJobStatus.RUNNING,
+            FlashcardJob.lease_token: token,
+            FlashcardJob.lease_expires_at: now + timedelta(seconds=JOB_LEASE_SECONDS),
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    return claimed == 1
+
+
+def _update_owned(db, job_id: int, token: str, **values) -> None:
+    """Обновляет задачу и продлевает аренду, только если она всё ещё наша"""
+    values["lease_expires_at"] = datetime.now(timezone.utc) + timedelta(seconds=JOB_LEASE_SECONDS)
+    updated = db.query(FlashcardJob).filter(
+        FlashcardJob.id == job_id,
+        FlashcardJob.lease_token == token,
+    ).update({getattr(FlashcardJob, key): value for key, value in values.items()}, synchronize_session=False)
+    if updated != 1:
+        raise LeaseLost()
+
+
+def _run_job(job_id: int) -> None:
+    db = SessionLocal()
+    token = uuid.uuid4().hex
+    try:
+        if not _claim(db, job_id, token):
+            return  # задачу уже выполняет другой воркер
+        job = db.query(FlashcardJob).filter(FlashcardJob.id == job_id).first()
+        # Всё нужное читаем сразу: после commit обращение к job открыло бы новую
+        # транзакцию, которая висела бы весь запрос к Gemini
+        user_id, language_id, topic = job.user_id, job.language_id, job.topic
+        language_code, source_text = job.language.code, job.source_text
+        requested_count, created_count = job.requested_count, job.created_count
+
+        # Уже созданные карточки (после перезапуска) не генерируем заново
+        seen_questions = {
+            question.strip().lower()
+            for (question,) in db.query(Flashcard.question).filter(
+                Flashcard.user_id == user_id,
+                Flashcard.language_id == language_id,
+            )
+        }
+
+        while created_count < requested_count:
+            wanted = min(JOB_CHUNK_SIZE, requested_count - created_count)
+            prompt = _build_prompt(language_code, topic, source_text, wanted)
+            pairs = _generate_with_retry(db, job_id, token, prompt, seen_questions)
+            if not pairs:
+                break
+
+            # Сигнатуры всего чанка и один поиск кандидатов по всем корзинам
+            pairs = pairs[:wanted]
+            signatures = [compute_signature(question, answer) for question, answer in pairs]
+            matches = find_duplicates_many(
+                db, user_id,
+                [(question, answer, signature) for (question, answer), signature in zip(pairs, signatures)],
+            )
+
+            cards = []
+            chunk_questions = set()
+            for (question, answer), signature, duplicates in zip(pairs, signatures, matches):
+                seen_questions.add(question.lower())
+                normalized_question = normalize_text(question)
+                # Карточку с тем же вопросом не добавляем, похожие только отмечаем
+                if normalized_question in chunk_questions or any(d.same_question for d in duplicates):
+                    continue
+                chunk_questions.add(normalized_question)
+                cards.append(Flashcard(
+                    question=question,
+                    answer=answer,
+                    topic=topic,
+                    status=FlashcardStatus.NEW,
+                    user_id=user_id,
+                    language_id=language_id,
+                    signature=signature,
+                    duplicate_of_id=duplicates[0].flashcard_id if duplicates else None,
+                ))
+            if not cards:
+                break
+            db.add_all(cards)
+            db.flush()  # один INSERT на чанк; после него у карточек есть id
+            db.add_all([band for card in cards for band in lsh_bands(card)])
+            # Карточки и счётчик коммитятся вместе и только пока аренда наша
+            created_count += len(cards)
+            _update_owned(db, job_id, token, created_count=created_count)
+            db.commit()
+
+        _update_owned(db, job_id, token, status=FlashcardJobStatus.DONE, lease_token=None)
+        db.commit()
+    except LeaseLost:
+        logger.warning("Flashcard job %s was taken over by another worker", job_id)
+        db.rollback()
+    except Exception as e:
+        logger.exception("Flashcard job %s failed", job_id)
+        db.rollback()
+        try:
+            _update_owned(db, job_id, token, status=FlashcardJobStatus.FAILED, error=str(e), lease_token=None)
+            db.commit()
+        except LeaseLost:
+            db.rollback()
+    finally:
+        db.close()
+        _release(job_id)
+
+
+def _generate_with_retry(db, job_id: int, token: str, prompt: str, seen_questions: set[str]) -> list[tuple[str, str]]:
+    """Запрос к Gemini с экспоненциальной задержкой между попытками"""
+    attempt = 0
+    while True:
+        attempt += 1
+        _update_owned(db, job_id, token, attempts=FlashcardJob.attempts + 1)
+        db.commit()
+        try:
+            return _generate_chunk(prompt, seen_questions)
+        except (GenerationParseError, *RETRYABLE_ERRORS) as e:
+            if attempt >= JOB_MAX_ATTEMPTS:
+                raise
+            delay = JOB_BACKOFF_SECONDS * 2 ** (attempt - 1)
+            delay += random.uniform(0, delay / 2)
+            logger.warning("Flashcard job %s: attempt %s failed (%s), retry in %.1fs", job_id, attempt, e, delay)
+            time.sleep(delay)
+
+
+def _generate_chunk(prompt: str, seen_questions: set[str]) -> list[tuple[str, str]]:
+    model = genai.GenerativeModel(
+        GEMINI_MODEL,
+        generation_config={"response_mime_type": "application/json"},
+    )
+    response = model.generate_content(prompt)
+    pairs = parse_flashcards(response.text)
+    return [(q, a) for q, a in pairs if q.lower() not in seen_questions]
+
+
+def _build_prompt(language_code: str, topic: str | None, source_text: str | None, count: int) -> str:
+    if source_text:
+        source = f"Use only words and phrases from this text:\n\"\"\"\n{source_text}\n\"\"\""
+    else:
+        source = f"Topic: {topic}"
+    return (
+        f"Create {count} vocabulary flashcards for a learner of the language '{language_code}'.\n"
+        f"{source}\n"
+        "Every question is a word or short phrase in that language, the answer is its translation "
+        "with a short example.\n"
+        'Respond with a JSON array only: [{"question": "...", "answer": "..."}]'
+    )
+
+
+def parse_flashcards(raw: str) -> list[tuple[str, str]]:
+    """Разбирает JSON-ответ Gemini в пары (вопрос, ответ)"""
+    text = raw.strip()
+    # Иногда модель всё равно оборачивает ответ в ```json ... ```
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.find("\n") + 1:] if "\n" in text else ""
+
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise GenerationParseError(f"Invalid JSON from model: {e}")
+
+    if isinstance(data, dict):
+        data = data.get("flashcards") or data.get("cards") or []
+    if not isinstance(data, list):
+        raise GenerationParseError("Expected a JSON array of flashcards")
+
+    pairs = []
+    seen = set()
+    for item in data:
+        if not isinstance(item, dict):
+            continue
+        question = str(item.get("question") or "").strip()
+        answer = str(item.get("answer") or "").strip()
+        if not question or not answer or question.lower() in seen:
+            continue
+        seen.add(question.lower())
+        pairs.append((question, answer))
+
+    if data and not pairs:
+        raise GenerationParseError("No usable flashcards in model output")
+    return pairs
@@ -1,27 +1,41 @@
 from fastapi import FastAPI, HTTPException, Depends, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import or_, func
 from jose import JWTError, jwt
 from fastapi import APIRouter 
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
-from app.database import get_db, Base, engine
-from app.models import User, Flashcard, Languages
+from app.database import get_db, get_read_db, estimate_row_count, Base, engine
+from app.models import User, Flashcard, Languages, FlashcardJob, ChatSession, QuizSession
 from app.schemas import (
-    UserLogin, UserSignup, UserResponse, Token, 
+    UserLogin, UserSignup, UsersPageResponse, Token, 
     FlashcardCreate, FlashcardResponse, 
     UserWithFlashcardsResponse, FlashcardStatusEnum,
     LanguageResponse, LanguageCreate,
-    FlashcardsPaginatedResponse, AIMessageRequest
+    FlashcardsPaginatedResponse, AIMessageRequest,
+    FlashcardGenerateRequest, FlashcardJobResponse,
+    DuplicateModeEnum, DuplicateGroupResponse, FlashcardExplanationResponse,
+    QuizSessionCreate, QuizBatchResponse, FlashcardFacetsResponse
 )
 from app.auth import (
     verify_password, create_access_token, 
     get_password_hash, SECRET_KEY, ALGORITHM
 )
+from app.jobs import submit_job, start_sweep as start_job_sweep, JobQueueFull
+from app.chat_memory import get_or_create_session, send_message
+from app.dedupe import (
+    compute_signature, find_duplicates, index_flashcard,
+    unindex_flashcard, scan_duplicates
+)
+from app import explanations
+from app.quiz import next_batch
+from app.facets import get_facets
+from app.revocation import is_revoked, revoke, start_sync as start_revocation_sync
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import Response
+from fastapi import Response, Request
+from datetime import datetime, timezone
 
 load_dotenv()
 # Создать таблицы, если их нет
@@ -43,7 +57,7 @@ app.add_middleware(
 # ========== OAuth2 и текущий пользователь ==========
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def _authenticate(token: str, db: Session) -> User:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -54,6 +68,9 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
         full_name: str = payload.get("sub")
         if full_name is None:
             raise credentials_exception
+        jti = payload.get("jti")
+        if jti is not None and is_revoked(jti):
+            raise credentials_exception
     except JWTError:
         raise credentials_exception
 
@@ -63,6 +80,15 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     return user
 
 
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    return _authenticate(token, db)
+
+
+# Для эндпоинтов на get_read_db: та же сессия, поэтому и пользователь читается с реплики
+def get_current_user_read(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
+    return _authenticate(token, db)
+
+
 # ========== Роутеры ==========
 
 # Роутер для аутентификации
@@ -110,7 +136,20 @@ def login(user: UserLogin, response: Response, db: Session = Depends(get_db)):
 
 
 @auth_router.post("/logout")
-def logout(response: Response):
+def logout(request: Request, response: Response, db: Session = Depends(get_db)):
+    # Отзываем токен из заголовка или cookie, чтобы он перестал работать до exp
+    token = request.cookies.get("access_token")
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if token:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            payload = {}
+        if payload.get("jti") and payload.get("exp"):
+            revoke(db, payload["jti"], datetime.fromtimestamp(payload["exp"], tz=timezone.utc))
+
     # Устанавливаем cookie с пустым значением и max_age=0, чтобы удалить её
     response.delete_cookie(
         key="access_token",
@@ -124,13 +163,40 @@ def logout():
 # Роутер для пользователей
 users_router = APIRouter(prefix="/users", tags=["Users"])
 
-@users_router.get("", response_model=list[UserResponse])
-def get_users(db: Session = Depends(get_db)):
-    users = db.query(User).all()
-    return users
+@users_router.get("", response_model=UsersPageResponse)
+def get_users(
+    db: Session = Depends(get_read_db),
+    after_id: int | None = Query(None, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+    q: str | None = Query(None, min_length=1),
+):
+    # Только нужные колонки, без хэша пароля
+    query = db.query(User.id, User.full_name, User.email)
+
+    if q:
+        # Поиск по префиксу использует индексы lower(...) text_pattern_ops
+        prefix = q.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        query = query.filter(
+            or_(
+                func.lower(User.full_name).like(prefix, escape="\\"),
+                func.lower(User.email).like(prefix, escape="\\"),
+            )
+        )
+
+    estimated_total = estimate_row_count(db, query)
+
+    if after_id is not None:
+        query = query.filter(User.id > after_id)
+    items = query.order_by(User.id).limit(limit).all()
+
+    return {
+        "items": items,
+        "next_after_id": items[-1].id if len(items) == limit else None,
+        "estimated_total": estimated_total,
+    }
 
 @users_router.get("/me", response_model=UserWithFlashcardsResponse)
-def read_me(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+def read_me(current_user: User = Depends(get_current_user_read), db: Session = Depends(get_read_db)):
     flashcards = db.query(Flashcard).filter(Flashcard.user_id == current_user.id).all()
     
     return {
@@ -147,8 +213,10 @@ flashcards_router = APIRouter(prefix="/flashcards", tags=["Flashcards"])
 @flashcards_router.post("", response_model=FlashcardResponse, status_code=201)
 def create_flashcard(
     flashcard: FlashcardCreate,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    duplicates: DuplicateModeEnum = Query(DuplicateModeEnum.FLAG),
 ):
     if not current_user:
         raise HTTPException(status_code=401, detail="Unauthorized")
@@ -156,6 +224,18 @@ def create_flashcard(
     language = db.query(Languages).filter_by(code=flashcard.language_code).first()
     if not language:
         raise HTTPException(status_code=404, detail="Language not found")
+
+    # Проверка на почти одинаковые карточки в колоде пользователя
+    signature = compute_signature(flashcard.question, flashcard.answer)
+    matches = find_duplicates(db, current_user.id, flashcard.question, flashcard.answer, signature)
+    # Сливаем только с карточкой с тем же вопросом, остальные похожие лишь отмечаем
+    same_question = [match for match in matches if match.same_question]
+    if same_question and duplicates == DuplicateModeEnum.MERGE:
+        response.status_code = status.HTTP_200_OK
+        return db.query(Flashcard).filter(
+            Flashcard.id == same_question[0].flashcard_id,
+            Flashcard.user_id == current_user.id
+        ).first()
     
     db_flashcard = Flashcard(
         question=flashcard.question,
@@ -163,24 +243,42 @@ def create_flashcard(
         topic=flashcard.topic,
         status=FlashcardStatusEnum.NEW,
         user_id=current_user.id,
-        language_id=language.id
+        language_id=language.id,
+        duplicate_of_id=matches[0].flashcard_id if matches else None
     )
     
     db.add(db_flashcard)
+    db.flush()
+    index_flashcard(db, db_flashcard, signature)
     db.commit()
     db.refresh(db_flashcard)
     return db_flashcard
 
 @flashcards_router.get("", response_model=FlashcardsPaginatedResponse)
 def get_flashcards(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read),
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     search: str | None = Query(None),
+    topic: str | None = Query(None),
+    no_topic: bool = Query(False),
+    language_code: str | None = Query(None),
 ):
     query = db.query(Flashcard).filter(Flashcard.user_id == current_user.id)
 
+    # Фасет «без темы» (value = null в /flashcards/facets) объединяет NULL и пустую строку
+    if no_topic:
+        query = query.filter(or_(Flashcard.topic.is_(None), Flashcard.topic == ""))
+    elif topic is not None:
+        query = query.filter(Flashcard.topic == topic)
+
+    if language_code:
+        language = db.query(Languages).filter_by(code=language_code).first()
+        if not language:
+            return {"total": 0, "items": []}
+        query = query.filter(Flashcard.language_id == language.id)
+
     if search:
         pattern = f"%{search}%"
         query = query.filter(
@@ -195,6 +293,76 @@ def get_flashcards(
 
     return {"total": total, "items": items}
 
+@flashcards_router.post("/generate", response_model=FlashcardJobResponse, status_code=202)
+def generate_flashcards(
+    request: FlashcardGenerateRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    language = db.query(Languages).filter_by(code=request.language_code).first()
+    if not language:
+        raise HTTPException(status_code=404, detail="Language not found")
+
+    job = FlashcardJob(
+        user_id=current_user.id,
+        language_id=language.id,
+        topic=request.topic,
+        source_text=request.text,
+        requested_count=request.count,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    # Генерация идёт в фоновом пуле, клиент поллит статус задачи
+    try:
+        submit_job(job.id)
+    except JobQueueFull:
+        db.delete(job)
+        db.commit()
+        raise HTTPException(status_code=429, detail="Too many generation jobs, try again later")
+    return job
+
+@flashcards_router.get("/jobs/{job_id}", response_model=FlashcardJobResponse)
+def get_generation_job(
+    job_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
+):
+    job = db.query(FlashcardJob).filter(
+        FlashcardJob.id == job_id,
+        FlashcardJob.user_id == current_user.id
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@flashcards_router.get("/facets", response_model=FlashcardFacetsResponse)
+def get_flashcard_facets(
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
+):
+    return get_facets(db, current_user.id)
+
+@flashcards_router.get("/duplicates", response_model=list[DuplicateGroupResponse])
+def get_duplicate_flashcards(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    groups = scan_duplicates(db, current_user.id)
+    ids = {flashcard_id for group in groups for flashcard_id in group}
+    cards = {
+        card.id: card
+        for card in db.query(Flashcard).filter(
+            Flashcard.user_id == current_user.id,
+            Flashcard.id.in_(ids)
+        )
+    } if ids else {}
+    return [
+        {"items": [cards[flashcard_id] for flashcard_id in group if flashcard_id in cards]}
+        for group in groups
+    ]
+
 @flashcards_router.get("/statuses")
 def get_flashcard_statuses():
     return [status.value for status in FlashcardStatusEnum]
@@ -202,13 +370,45 @@ def get_flashcard_statuses():
 @flashcards_router.get("/{flashcard_id}", response_model=FlashcardResponse)
 def get_flashcard(
     flashcard_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user_read)
 ):
-    db_flashcard = db.query(Flashcard).filter(Flashcard.id == flashcard_id).first()
+    # Фильтр по user_id позволяет Postgres читать только одну партицию
+    db_flashcard = db.query(Flashcard).filter(
+        Flashcard.id == flashcard_id,
+        Flashcard.user_id == current_user.id
+    ).first()
     if not db_flashcard:
         raise HTTPException(status_code=404, detail="Flashcard not found")
     return db_flashcard
 
+@flashcards_router.get("/{flashcard_id}/explanation", response_model=FlashcardExplanationResponse)
+def get_flashcard_explanation(
+    flashcard_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    db_flashcard = db.query(Flashcard).filter(
+        Flashcard.id == flashcard_id,
+        Flashcard.user_id == current_user.id
+    ).first()
+    if not db_flashcard:
+        raise HTTPException(status_code=404, detail="Flashcard not found")
+
+    try:
+        explanation, cached = explanations.get_or_create(
+            db, db_flashcard.question, db_flashcard.answer, db_flashcard.language_code
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return {
+        "flashcard_id": db_flashcard.id,
+        "language_code": explanation.language_code,
+        "explanation": explanation.explanation,
+        "cached": cached,
+    }
+
 @flashcards_router.put("/{flashcard_id}", response_model=FlashcardResponse)
 def update_flashcard(
     flashcard_id: int,
@@ -223,12 +423,31 @@ def update_flashcard(
     if not db_flashcard:
         raise HTTPException(status_code=404, detail="Flashcard not found")
     
+    text_changed = (
+        db_flashcard.question != flashcard_update.question
+        or db_flashcard.answer != flashcard_update.answer
+    )
+    old_explanation_key = explanations.explanation_key(
+        db_flashcard.question, db_flashcard.answer, db_flashcard.language_code
+    )
     db_flashcard.question = flashcard_update.question
     db_flashcard.answer = flashcard_update.answer
     db_flashcard.status = flashcard_update.status
+    if text_changed:
+        index_flashcard(db, db_flashcard)
+        matches = find_duplicates(
+            db, current_user.id, db_flashcard.question, db_flashcard.answer,
+            db_flashcard.signature, exclude_id=db_flashcard.id
+        )
+        db_flashcard.duplicate_of_id = matches[0].flashcard_id if matches else None
     
     db.commit()
     db.refresh(db_flashcard)
+
+    # Изменённая карточка получает новый ключ объяснения; если старое уже
+    # запрашивали, готовим новое в фоне
+    if text_changed and explanations.get_cached(db, old_explanation_key) is not None:
+        explanations.warm(db_flashcard.question, db_flashcard.answer, db_flashcard.language_code)
     return db_flashcard
 
 @flashcards_router.delete("/{flashcard_id}", status_code=204)
@@ -244,6 +463,12 @@ def delete_flashcard(
     if not db_flashcard:
         raise HTTPException(status_code=404, detail="Flashcard not found")
     
+    unindex_flashcard(db, db_flashcard.id)
+    # Карточки, отмеченные дубликатом удаляемой, больше ни на что не ссылаются
+    db.query(Flashcard).filter(
+        Flashcard.user_id == current_user.id,
+        Flashcard.duplicate_of_id == db_flashcard.id
+    ).update({Flashcard.duplicate_of_id: None}, synchronize_session=False)
     db.delete(db_flashcard)
     db.commit()
     return
@@ -266,18 +491,69 @@ def create_language(language: LanguageCreate, db: Session = Depends(get_db)):
     return new_language
 
 @languages_router.get("", response_model=list[LanguageResponse])
-def get_languages(db: Session = Depends(get_db)):
+def get_languages(db: Session = Depends(get_read_db)):
     languages = db.query(Languages).all()
     return languages
 
 
+# Роутер для квизов
+quiz_router = APIRouter(prefix="/quiz", tags=["Quiz"])
+
+@quiz_router.post("/sessions", response_model=QuizBatchResponse, status_code=201)
+def create_quiz_session(
+    request: QuizSessionCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    language_id = None
+    if request.language_code:
+        language = db.query(Languages).filter_by(code=request.language_code).first()
+        if not language:
+            raise HTTPException(status_code=404, detail="Language not found")
+        language_id = language.id
+
+    session = QuizSession(
+        user_id=current_user.id,
+        status=request.status,
+        language_id=language_id,
+        topic=request.topic,
+        seen=[],
+    )
+    db.add(session)
+    db.flush()
+
+    items = next_batch(db, session, request.size)
+    db.commit()
+    return {"session_id": session.id, "items": items, "exhausted": len(items) < request.size}
+
+@quiz_router.post("/sessions/{session_id}/next", response_model=QuizBatchResponse)
+def next_quiz_batch(
+    session_id: int,
+    size: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    session = db.query(QuizSession).filter(
+        QuizSession.id == session_id,
+        QuizSession.user_id == current_user.id
+    ).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Quiz session not found")
+
+    items = next_batch(db, session, size)
+    db.commit()
+    return {"session_id": session.id, "items": items, "exhausted": len(items) < size}
+
+
 # Роутер для AI 
 
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
 chat_router = APIRouter(prefix="/chat", tags=["Chat"])
+# Обычный def: FastAPI выполняет его в пуле потоков, и блокирующие вызовы
+# Gemini и БД не останавливают event loop
 @chat_router.post("/message")
-async def chat_with_ai(
+def chat_with_ai(
     request: AIMessageRequest,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user),
@@ -342,23 +618,54 @@ async def chat_with_ai(
         )
         return {"response": f"Вот твои изученные флешкарты:\n{cards_text}"}
 
-    # Остальные сообщения отправляем в Gemini
+    # Остальные сообщения отправляем в Gemini с памятью сессии
+    session = get_or_create_session(db, current_user.id, request.session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+
+    session_id = session.id
     try:
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(request.message)
-        return {"response": response.text}
+        answer = send_message(db, session, request.message)
     except Exception as e:
+        db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
 
+    return {"response": answer, "session_id": session_id}
+
+@chat_router.delete("/sessions/{session_id}", status_code=204)
+def delete_chat_session(
+    session_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    session = db.query(ChatSession).filter(
+        ChatSession.id == session_id,
+        ChatSession.user_id == current_user.id
+    ).first()
+    if not session:
+        raise HTTPException(status_code=404, detail="Chat session not found")
+
+    db.delete(session)
+    db.commit()
+    return
+
 
 # ========== Подключение роутеров ==========
 app.include_router(auth_router)
 app.include_router(users_router)
 app.include_router(flashcards_router)
 app.include_router(languages_router)
+app.include_router(quiz_router)
 app.include_router(chat_router)
 
 
+# Незавершённые задачи генерации после перезапуска
+@app.on_event("startup")
+def on_startup():
+    start_job_sweep()
+    start_revocation_sync()
+
+
 # ========== Главная страница ==========
 @app.get("/")
 def read_root():
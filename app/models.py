@@ -1,7 +1,7 @@
 from sqlalchemy import Column, Integer, String
 from .database import Base
 from sqlalchemy.orm import relationship
-from sqlalchemy import ForeignKey, DateTime
+from sqlalchemy import ForeignKey, DateTime, Text, JSON, Index, LargeBinary, BigInteger
 from sqlalchemy.sql import func
 from enum import Enum
 from sqlalchemy import Column, String, Enum as SqlEnum
@@ -16,6 +16,21 @@ class User(Base):
     password = Column(String, nullable=False) 
     flashcards = relationship("Flashcard", back_populates="user")
 
+    # Поиск по префиксу: text_pattern_ops нужен, чтобы LIKE 'prefix%' использовал
+    # индекс при любой локали (миграция 994b66905a3d)
+    __table_args__ = (
+        Index(
+            "ix_users_lower_full_name",
+            func.lower(full_name).label("lower_full_name"),
+            postgresql_ops={"lower_full_name": "text_pattern_ops"},
+        ),
+        Index(
+            "ix_users_lower_email",
+            func.lower(email).label("lower_email"),
+            postgresql_ops={"lower_email": "text_pattern_ops"},
+        ),
+    )
+
 
 class FlashcardStatus(str, Enum):
     NEW = "new"
@@ -24,6 +39,13 @@ class FlashcardStatus(str, Enum):
  
 class Flashcard(Base):
     __tablename__ = "flashcards"
+    # В Postgres таблица партиционирована по HASH (user_id) (миграция 4b5c57149121),
+    # поэтому запросы к карточкам всегда фильтруем по user_id
+    __table_args__ = (
+        Index("ix_flashcards_user_id_id", "user_id", "id"),
+        Index("ix_flashcards_user_id_topic", "user_id", "topic"),
+        Index("ix_flashcards_user_id_language_id", "user_id", "language_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     topic = Column(String, nullable=True)
@@ -34,15 +56,37 @@ class Flashcard(Base):
     status = Column(SqlEnum(FlashcardStatus), nullable=False, default=FlashcardStatus.NEW)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # MinHash-сигнатура вопроса и ответа (app/dedupe.py)
+    signature = Column(LargeBinary, nullable=True)
+    # Похожая карточка, найденная при создании
+    duplicate_of_id = Column(Integer, nullable=True)
 
     user = relationship("User", back_populates="flashcards")
     language = relationship("Languages", back_populates="flashcards")
 
+    # Identity в ORM — (id, user_id), как ключ партиционированной таблицы, поэтому
+    # UPDATE/DELETE из ORM фильтруют по user_id и читают одну партицию. В DDL ключ
+    # остаётся на id, чтобы create_all работал и на SQLite
+    __mapper_args__ = {"primary_key": [id, user_id]}
+
     @property
     def language_code(self) -> str | None:
         """Возвращает код языка для Pydantic сериализации"""
         return self.language.code if self.language else None
 
+class FlashcardLshBand(Base):
+    """LSH-корзины сигнатур для поиска дубликатов внутри колоды пользователя"""
+    __tablename__ = "flashcard_lsh_bands"
+    __table_args__ = (
+        Index("ix_flashcard_lsh_bands_lookup", "user_id", "band", "bucket"),
+    )
+
+    # Без FK на flashcards: у партиционированной таблицы ключ (id, user_id)
+    flashcard_id = Column(Integer, primary_key=True)
+    band = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False)
+    bucket = Column(BigInteger, nullable=False)
+
 class Languages(Base):
     __tablename__ = "languages"
     id = Column(Integer, primary_key=True, index=True)
@@ -50,3 +94,95 @@ class Languages(Base):
 
     flashcards = relationship("Flashcard", back_populates="language")
 
+
+
+class FlashcardJobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class FlashcardJob(Base):
+    """Фоновая генерация флешкарт через Gemini"""
+    __tablename__ = "flashcard_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    language_id = Column(Integer, ForeignKey("languages.id"), nullable=False)
+    topic = Column(String, nullable=True)
+    source_text = Column(Text, nullable=True)
+    requested_count = Column(Integer, nullable=False)
+    created_count = Column(Integer, nullable=False, default=0)
+    status = Column(SqlEnum(FlashcardJobStatus), nullable=False, default=FlashcardJobStatus.PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    # Аренда воркера, выполняющего задачу (app/jobs.py)
+    lease_token = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    language = relationship("Languages")
+
+    @property
+    def progress(self) -> int:
+        """Процент готовности для поллинга"""
+        if not self.requested_count:
+            return 0
+        return min(100, self.created_count * 100 // self.requested_count)
+
+
+class ChatSession(Base):
+    """Память диалога с Gemini: краткое резюме + последние реплики"""
+    __tablename__ = "chat_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    summary = Column(Text, nullable=True)
+    # [{"role": "user" | "model", "text": "..."}]
+    turns = Column(JSON, nullable=False, default=list)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class CardExplanation(Base):
+    """Объяснение карточки от Gemini, общее для всех пользователей (app/explanations.py)"""
+    __tablename__ = "card_explanations"
+
+    # sha256 от кода языка и нормализованных вопроса/ответа
+    key = Column(String(64), primary_key=True)
+    language_code = Column(String, nullable=False)
+    explanation = Column(Text, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class QuizSession(Base):
+    """Состояние квиза: фильтры и id уже выданных карточек (app/quiz.py)"""
+    __tablename__ = "quiz_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(SqlEnum(FlashcardStatus), nullable=True)
+    language_id = Column(Integer, ForeignKey("languages.id"), nullable=True)
+    topic = Column(String, nullable=True)
+    seen = Column(JSON, nullable=False, default=list)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class FlashcardFacetCount(Base):
+    """Сколько карточек у пользователя в каждой теме, языке и статусе (app/facets.py)"""
+    __tablename__ = "flashcard_facet_counts"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    facet = Column(String, primary_key=True)  # topic | language | status
+    value = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class RevokedToken(Base):
+    """Отозванные при logout JWT (app/revocation.py)"""
+    __tablename__ = "revoked_tokens"
+
+    jti = Column(String, primary_key=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    revoked_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -0,0 +1,57 @@
+"""Случайная выборка карточек для квиза без ORDER BY random().
+
+Каждая карточка берётся через случайную точку в диапазоне id колоды:
+WHERE user_id = ? AND id >= pivot ORDER BY id LIMIT 1 — это один seek по индексу
+(user_id, id), а не сортировка всей колоды. Если за pivot ничего нет, ищем с начала.
+Карточки после больших «дыр» в id выпадают чуть чаще — для квиза это приемлемо.
+Сессия хранит только фильтры и список уже выданных id.
+"""
+import random
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models import Flashcard, QuizSession
+
+# Сколько карточек максимум выдаём за одну сессию
+QUIZ_SESSION_MAX_CARDS = 500
+
+
+def _deck_query(db: Session, session: QuizSession):
+    query = db.query(Flashcard).filter(Flashcard.user_id == session.user_id)
+    if session.status is not None:
+        query = query.filter(Flashcard.status == session.status)
+    if session.language_id is not None:
+        query = query.filter(Flashcard.language_id == session.language_id)
+    if session.topic is not None:
+        query = query.filter(Flashcard.topic == session.topic)
+    return query
+
+
+def next_batch(db: Session, session: QuizSession, size: int) -> list[Flashcard]:
+    """Выбирает до size новых карточек и отмечает их в сессии как выданные"""
+    seen = list(session.seen)
+    size = min(size, QUIZ_SESSION_MAX_CARDS - len(seen))
+    if size <= 0:
+        return []
+
+    deck = _deck_query(db, session)
+    low, high = deck.with_entities(func.min(Flashcard.id), func.max(Flashcard.id)).order_by(None).one()
+    if low is None:
+        return []
+
+    picked = []
+    for _ in range(size):
+        unseen = deck.filter(Flashcard.id.notin_(seen)) if seen else deck
+        pivot = random.randint(low, high)
+        card = unseen.filter(Flashcard.id >= pivot).order_by(Flashcard.id).first()
+        if card is None:
+            card = unseen.filter(Flashcard.id < pivot).order_by(Flashcard.id).first()
+        if card is None:
+            break  # в колоде не осталось невыданных карточек
+        picked.append(card)
+        seen.append(card.id)
+
+    # JSON-колонку переприсваиваем целиком, чтобы SQLAlchemy увидел изменение
+    session.seen = seen
+    return picked
@@ -0,0 +1,83 @@
+"""Отзыв JWT при logout.
+
+get_current_user проверяет jti по словарю в памяти процесса — O(1), без запроса в БД.
+Отозванные токены хранятся в revoked_tokens, и фоновый поток каждые
+REVOCATION_SYNC_SECONDS подтягивает новые записи, чтобы отзыв в одном воркере
+увидели остальные. Записи удаляются, когда истекает срок действия токена.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.exc import IntegrityError
+
+from app.database import SessionLocal
+from app.models import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", 5))
+
+# jti -> unix-время истечения токена
+_revoked: dict[str, float] = {}
+_last_synced_at: datetime | None = None
+_sync_thread: threading.Thread | None = None
+
+
+def is_revoked(jti: str) -> bool:
+    return jti in _revoked
+
+
+def revoke(db, jti: str, expires_at: datetime) -> None:
+    _revoked[jti] = expires_at.timestamp()
+    db.add(RevokedToken(jti=jti, expires_at=expires_at))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()  # токен уже отозван
+
+
+def sync() -> None:
+    """Подтягивает новые отзывы из БД и чистит истёкшие"""
+    global _last_synced_at
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        query = db.query(RevokedToken.jti, RevokedToken.expires_at).filter(RevokedToken.expires_at > now)
+        if _last_synced_at is not None:
+            # Перекрытие на случай долгих транзакций и расхождения часов
+            query = query.filter(
+                RevokedToken.revoked_at >= _last_synced_at - timedelta(seconds=REVOCATION_SYNC_SECONDS * 2)
+            )
+        for jti, expires_at in query:
+            _revoked[jti] = expires_at.timestamp()
+
+        db.query(RevokedToken).filter(RevokedToken.expires_at <= now).delete(synchronize_session=False)
+        db.commit()
+        _last_synced_at = now
+    finally:
+        db.close()
+
+    expired_at = time.time()
+    for jti in [jti for jti, exp in list(_revoked.items()) if exp <= expired_at]:
+        _revoked.pop(jti, None)
+
+
+def _sync_forever() -> None:
+    while True:
+        time.sleep(REVOCATION_SYNC_SECONDS)
+        try:
+            sync()
+        except Exception:
+            logger.exception("Failed to sync revoked tokens")
+
+
+def start_sync() -> None:
+    global _sync_thread
+    if _sync_thread is not None:
+        return
+    sync()
+    _sync_thread = threading.Thread(target=_sync_forever, name="token-revocation-sync", daemon=True)
+    _sync_thread.start()
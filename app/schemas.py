@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, validator
+from pydantic import BaseModel, EmailStr, Field, root_validator, validator
 from datetime import datetime
 from enum import Enum
 from typing import List
@@ -34,6 +34,11 @@ class UserResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class UsersPageResponse(BaseModel):
+    items: list[UserResponse]
+    next_after_id: int | None
+    estimated_total: int
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -84,10 +89,24 @@ class FlashcardResponse(BaseModel):
     status: str
     created_at: datetime | None = None
     updated_at: datetime | None = None
+    duplicate_of_id: int | None = None
     user:UserResponse
     class Config:
         orm_mode = True
 
+class DuplicateModeEnum(str, Enum):
+    FLAG = "flag"    # создать карточку и отметить duplicate_of_id
+    MERGE = "merge"  # не создавать, вернуть существующую с тем же вопросом (иначе как flag)
+
+class DuplicateGroupResponse(BaseModel):
+    items: list[FlashcardResponse]
+
+class FlashcardExplanationResponse(BaseModel):
+    flashcard_id: int
+    language_code: str
+    explanation: str
+    cached: bool
+
 
 class UserWithFlashcardsResponse(BaseModel):
     id: int
@@ -105,7 +124,68 @@ class FlashcardsPaginatedResponse(BaseModel):
     items: list[FlashcardResponse]
 
 
+class FacetCount(BaseModel):
+    value: str | None
+    count: int
+
+class FlashcardFacetsResponse(BaseModel):
+    topics: list[FacetCount]
+    languages: list[FacetCount]
+    statuses: list[FacetCount]
+
+
 
 class AIMessageRequest(BaseModel):
-    message: str    
+    message: str
+    session_id: int | None = None
+
+
+
+# Flashcard generation jobs
+
+class FlashcardGenerateRequest(BaseModel):
+    language_code: str
+    topic: str | None = None
+    text: str | None = Field(None, max_length=20000)
+    count: int = Field(10, ge=1, le=100)
+
+    @root_validator(skip_on_failure=True)
+    def topic_or_text(cls, values):
+        if not values.get("topic") and not values.get("text"):
+            raise ValueError("Either topic or text is required")
+        return values
 
+class FlashcardJobStatusEnum(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class FlashcardJobResponse(BaseModel):
+    id: int
+    status: FlashcardJobStatusEnum
+    topic: str | None
+    requested_count: int
+    created_count: int
+    progress: int
+    attempts: int
+    error: str | None = None
+    created_at: datetime | None = None
+    updated_at: datetime | None = None
+
+    class Config:
+        orm_mode = True
+
+
+# Quiz Schemas
+
+class QuizSessionCreate(BaseModel):
+    size: int = Field(10, ge=1, le=50)
+    status: FlashcardStatusEnum | None = None
+    language_code: str | None = None
+    topic: str | None = None
+
+class QuizBatchResponse(BaseModel):
+    session_id: int
+    items: list[FlashcardResponse]
+    exhausted: bool
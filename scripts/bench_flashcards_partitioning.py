@@ -0,0 +1,137 @@
+"""Бенчмарк запросов к flashcards до и после партиционирования по user_id.
+
+Запуск (Postgres из DATABASE_URL):
+
+    python -m scripts.bench_flashcards_partitioning --seed --rows 10000000 --users 100000
+    alembic upgrade 4b5c57149121
+    python -m scripts.bench_flashcards_partitioning
+
+Скрипт строит SQL теми же ORM-запросами, что и эндпоинты, проверяет через
+EXPLAIN, что читается одна партиция (в том числе для UPDATE/DELETE по ключу
+маппера), и печатает p50/p95 задержки на пользователя.
+"""
+import argparse
+import json
+import statistics
+import time
+
+from sqlalchemy import delete, inspect, text, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from app.database import engine
+from app.models import Flashcard, FlashcardStatus
+
+
+def seed(db: Session, rows: int, users: int) -> None:
+    print(f"Seeding {rows} flashcards for {users} users...")
+    db.execute(text("""
+        INSERT INTO users (full_name, email, password)
+        SELECT 'bench user ' || g, 'bench' || g || '@example.com', 'x'
+        FROM generate_series(1, :users) AS g
+        ON CONFLICT (email) DO NOTHING
+    """), {"users": users})
+    db.execute(text("INSERT INTO languages (code) VALUES ('bench') ON CONFLICT (code) DO NOTHING"))
+    db.execute(text("""
+        INSERT INTO flashcards (topic, question, answer, user_id, language_id, status, created_at)
+        SELECT 'topic ' || (g % 50), 'question ' || g, 'answer ' || g,
+               u.id, l.id, 'NEW', now()
+        FROM generate_series(1, :rows) AS g
+        JOIN (SELECT id, row_number() OVER (ORDER BY id) AS n
+              FROM users WHERE email LIKE 'bench%') AS u ON u.n = 1 + g % :users
+        CROSS JOIN (SELECT id FROM languages WHERE code = 'bench') AS l
+    """), {"rows": rows, "users": users})
+    db.commit()
+    db.execute(text("ANALYZE flashcards"))
+
+
+def hot_queries(db: Session, user_id: int) -> dict:
+    """Те же запросы, что в get_flashcards / get_flashcard"""
+    deck = db.query(Flashcard).filter(Flashcard.user_id == user_id)
+    return {
+        "count": deck.with_entities(Flashcard.id).order_by(None).statement,
+        "page": deck.offset(0).limit(10).statement,
+        "by_id": db.query(Flashcard).filter(Flashcard.id == 1, Flashcard.user_id == user_id).statement,
+    }
+
+
+def write_queries(user_id: int) -> dict:
+    """UPDATE/DELETE, которые ORM выполняет при flush — WHERE по ключу маппера.
+
+    Их только EXPLAIN'им (без ANALYZE), данные не меняются.
+    """
+    identity = {"id": 1, "user_id": user_id}
+    by_identity = [column == identity[column.key] for column in inspect(Flashcard).primary_key]
+    return {
+        "update": update(Flashcard).where(*by_identity).values(status=FlashcardStatus.DONE),
+        "delete": delete(Flashcard).where(*by_identity),
+    }
+
+
+def explain(db: Session, sql: str) -> set[str]:
+    plan = db.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+    plan = plan if isinstance(plan, list) else json.loads(plan)
+    return scanned_relations(plan[0]["Plan"])
+
+
+def compile_sql(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def scanned_relations(plan: dict) -> set[str]:
+    relations = set()
+    if "Relation Name" in plan:
+        relations.add(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        relations |= scanned_relations(child)
+    return relations
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seed", action="store_true")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+
+    with Session(engine) as db:
+        if args.seed:
+            seed(db, args.rows, args.users)
+
+        partitioned = db.execute(text(
+            "SELECT relkind = 'p' FROM pg_class WHERE relname = 'flashcards'"
+        )).scalar()
+        user_ids = [row[0] for row in db.execute(text(
+            "SELECT id FROM users WHERE email LIKE 'bench%' ORDER BY random() LIMIT :n"
+        ), {"n": args.samples})]
+        print(f"flashcards partitioned: {bool(partitioned)}, sampled users: {len(user_ids)}")
+
+        timings: dict[str, list[float]] = {}
+        for user_id in user_ids:
+            for name, statement in hot_queries(db, user_id).items():
+                sql = compile_sql(statement)
+                if name == "count":
+                    sql = f"SELECT count(*) FROM ({sql}) AS deck"
+
+                relations = explain(db, sql)
+                if partitioned and len(relations) != 1:
+                    raise SystemExit(f"{name}: no partition pruning, scanned {sorted(relations)}")
+
+                started = time.perf_counter()
+                db.execute(text(sql)).all()
+                timings.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+
+            for name, statement in write_queries(user_id).items():
+                relations = explain(db, compile_sql(statement))
+                if partitioned and len(relations) != 1:
+                    raise SystemExit(f"{name}: no partition pruning, scanned {sorted(relations)}")
+
+        for name, values in timings.items():
+            values.sort()
+            p95 = values[int(len(values) * 0.95) - 1] if len(values) > 1 else values[0]
+            print(f"{name:>6}: p50 {statistics.median(values):.2f} ms, p95 {p95:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()